@@ -1,4 +1,6 @@
 import os
+import io
+import hashlib
 import zipfile
 from pathlib import Path
 import PyPDF2
@@ -7,7 +9,7 @@ import re
 import time
 import openai
 import json
-from typing import Dict, List, Optional
+from typing import Dict, List, Optional, Tuple
 
 # ------------ CONFIG ------------
 PDF_INPUT = './pdf_to_scorm/Lesson Plan 2 - Argument Construction.docx.pdf'
@@ -16,15 +18,37 @@ SCO_IDENTIFIER = 'SCO-1'
 ORG_IDENTIFIER = 'ORG-1'
 COURSE_IDENTIFIER = 'COURSE-ARG-CONSTRUCT'
 OUTPUT_ZIP = 'pdf_to_scorm/scorm_package.zip'
+PACKAGE_HASH_FILE = 'pdf_to_scorm/scorm_package.sha256.json'  # content-hash sidecar read by the LMS sync job
 LAUNCH_FILE = 'pdf_to_scorm/index.html'  # main SCO launch page
 SCORM_VERSION = '1.2'  # '1.2' or '2004'
+ZIP_FIXED_DATE_TIME = (1980, 1, 1, 0, 0, 0)  # earliest ZIP timestamp, keeps archives reproducible
+ZIP_COMPRESS_LEVEL = 9
+GENERATOR_VERSION = 1  # bump when packaging logic changes in a way the template fingerprint misses
+
+# Model tiers, smallest first. A document is routed to the fast tier when it fits
+# its size limits and the per-document budget. Invalid output escalates to the next
+# larger tier, but only to tiers whose estimate fits what is left of the budget after
+# the calls already made. When no tier fits, or the API call itself fails, the static
+# fallback content is used instead.
+# the newest OpenAI model is "gpt-5" which was released August 7, 2025. do not change this unless explicitly requested by the user
+MODEL_TIERS = [
+    {"name": "fast", "model": "gpt-5-mini", "max_chars": 24000, "max_pages": 12,
+     "seconds_per_1k_tokens": 0.8, "usd_per_1k_tokens": 0.002},
+    {"name": "large", "model": "gpt-5", "max_chars": None, "max_pages": None,
+     "seconds_per_1k_tokens": 2.0, "usd_per_1k_tokens": 0.01},
+]
+LATENCY_BUDGET_SECONDS = 120  # per document
+COST_BUDGET_USD = 0.50  # per document
+EXPECTED_OUTPUT_TOKENS = 3000
+METRICS_FILE = 'pdf_to_scorm/model_tier_metrics.json'
 
 # Initialize OpenAI client
 openai.api_key = os.getenv('OPENAI_API_KEY')
 client = openai.OpenAI(api_key=os.getenv('OPENAI_API_KEY'))
 # --------------------------------
 
-def extract_pdf_text(pdf_path: str) -> str:
+def extract_pdf_text(pdf_path: str) -> Tuple[str, int]:
+    """Return the normalized text of the PDF and its page count"""
     with open(pdf_path, 'rb') as f:
         reader = PyPDF2.PdfReader(f)
         chunks = []
@@ -37,13 +61,174 @@ def extract_pdf_text(pdf_path: str) -> str:
         text = "\n".join(chunks)
         # Normalize whitespace a bit
         text = re.sub(r'\n{3,}', '\n\n', text)
-        return text.strip()
+        return text.strip(), len(reader.pages)
+
+def estimate_tokens(raw_text: str) -> int:
+    # ~4 characters per token plus the fixed instructions and the expected JSON output
+    return len(raw_text) // 4 + 500 + EXPECTED_OUTPUT_TOKENS
+
+def affordable_tiers(raw_text: str, latency_budget: float = LATENCY_BUDGET_SECONDS,
+                     cost_budget: float = COST_BUDGET_USD) -> List[int]:
+    """Indexes of the tiers whose estimated latency and cost fit the per-document budget"""
+    tokens = estimate_tokens(raw_text)
+    affordable = []
+    for i, tier in enumerate(MODEL_TIERS):
+        latency = tokens / 1000 * tier['seconds_per_1k_tokens']
+        cost = tokens / 1000 * tier['usd_per_1k_tokens']
+        if latency <= latency_budget and cost <= cost_budget:
+            affordable.append(i)
+    return affordable
+
+def select_model_tier(raw_text: str, page_count: int,
+                      latency_budget: float = LATENCY_BUDGET_SECONDS,
+                      cost_budget: float = COST_BUDGET_USD) -> Optional[int]:
+    """Pick the index of the model tier to start with, or None if no tier fits the budget"""
+    affordable = affordable_tiers(raw_text, latency_budget, cost_budget)
+
+    if not affordable:
+        return None
+
+    for i in affordable:
+        tier = MODEL_TIERS[i]
+        fits_chars = tier['max_chars'] is None or len(raw_text) <= tier['max_chars']
+        fits_pages = tier['max_pages'] is None or page_count <= tier['max_pages']
+        if fits_chars and fits_pages:
+            return i
+
+    # Too big for every affordable tier, use the most capable one we can afford
+    return affordable[-1]
+
+def _is_text(value) -> bool:
+    return isinstance(value, str) and bool(value.strip())
+
+def validate_enhanced_content(content: Dict) -> List[str]:
+    """Return a list of problems with the model output, empty if it is usable"""
+    errors = []
+    if not isinstance(content, dict):
+        return ["response is not a JSON object"]
 
-def enhance_content_with_ai(raw_text: str, title: str) -> Dict:
-    """Use OpenAI to analyze and enhance the PDF content"""
-    # the newest OpenAI model is "gpt-5" which was released August 7, 2025. do not change this unless explicitly requested by the user
+    for key in ('introduction', 'summary'):
+        if not isinstance(content.get(key), str) or not content[key].strip():
+            errors.append(f"missing {key}")
+
+    objectives = content.get('learning_objectives')
+    if not isinstance(objectives, list) or not objectives:
+        errors.append("missing learning_objectives")
+    elif not all(_is_text(objective) for objective in objectives):
+        errors.append("learning_objectives must be non-empty strings")
+
+    sections = content.get('sections')
+    if not isinstance(sections, list) or not sections:
+        errors.append("missing sections")
+    else:
+        for i, section in enumerate(sections):
+            if not isinstance(section, dict) or not isinstance(section.get('title'), str) \
+                    or not isinstance(section.get('content'), str):
+                errors.append(f"section {i} needs a title and content")
+
+    quiz = content.get('quiz', [])
+    if not isinstance(quiz, list):
+        errors.append("quiz is not a list")
+    else:
+        for i, item in enumerate(quiz):
+            options = item.get('options') if isinstance(item, dict) else None
+            if not isinstance(options, list) or not options or not _is_text(item.get('question')):
+                errors.append(f"quiz question {i} needs a question and options")
+            elif not all(_is_text(option) for option in options):
+                errors.append(f"quiz question {i} options must be non-empty strings")
+            elif not isinstance(item.get('explanation', ''), str):
+                errors.append(f"quiz question {i} explanation is not a string")
+            elif not isinstance(item.get('correct'), int) or not 0 <= item['correct'] < len(options):
+                errors.append(f"quiz question {i} has an invalid correct answer")
+
+    activity = content.get('activity')
+    if activity is not None and (not isinstance(activity, dict)
+                                 or not isinstance(activity.get('title'), str)
+                                 or not isinstance(activity.get('description'), str)):
+        errors.append("activity needs a title and description")
+
+    return errors
+
+def load_tier_metrics(metrics_file: str = METRICS_FILE) -> Dict:
     try:
-        prompt = f"""
+        with open(metrics_file, 'r', encoding='utf-8') as f:
+            metrics = json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
+    return metrics if isinstance(metrics, dict) else {}
+
+def record_tier_metrics(tier_name: str, latency: float, prompt_tokens: int, completion_tokens: int,
+                        escalated: bool, rejected: bool, failed: bool = False,
+                        metrics_file: str = METRICS_FILE) -> Dict:
+    """Accumulate per-tier latency, token, escalation, rejection and failure counts across runs"""
+    metrics = load_tier_metrics(metrics_file)
+    stats = metrics.get(tier_name)
+    if not isinstance(stats, dict):
+        stats = metrics[tier_name] = {}
+    for key in ('calls', 'escalations', 'rejections', 'failures', 'prompt_tokens', 'completion_tokens'):
+        stats.setdefault(key, 0)
+    stats.setdefault('total_latency_seconds', 0.0)
+
+    stats['calls'] += 1
+    stats['escalations'] += 1 if escalated else 0
+    stats['rejections'] += 1 if rejected else 0
+    stats['failures'] += 1 if failed else 0
+    stats['total_latency_seconds'] = round(stats['total_latency_seconds'] + latency, 3)
+    stats['prompt_tokens'] += prompt_tokens
+    stats['completion_tokens'] += completion_tokens
+    stats['avg_latency_seconds'] = round(stats['total_latency_seconds'] / stats['calls'], 3)
+    stats['escalation_rate'] = round(stats['escalations'] / stats['calls'], 4)
+    stats['rejection_rate'] = round(stats['rejections'] / stats['calls'], 4)
+    stats['failure_rate'] = round(stats['failures'] / stats['calls'], 4)
+
+    with open(metrics_file, 'w', encoding='utf-8') as f:
+        json.dump(metrics, f, indent=2, sort_keys=True)
+        f.write("\n")
+    return stats
+
+def call_model_tier(tier: Dict, prompt: str) -> Dict:
+    """Run the enhancement prompt on one tier. Returns the parsed content plus call stats.
+
+    `failed` means the API call itself did not complete (network, auth, rate limit);
+    `errors` without `failed` means the model answered with unusable output.
+    """
+    start = time.monotonic()
+    content = None
+    failed = False
+    prompt_tokens = completion_tokens = 0
+    try:
+        response = client.chat.completions.create(
+            model=tier['model'],
+            messages=[
+                {"role": "system", "content": "You are an expert educational content designer who creates engaging, well-structured learning materials."},
+                {"role": "user", "content": prompt}
+            ],
+            response_format={"type": "json_object"}
+        )
+    except Exception as e:
+        failed = True
+        errors = [str(e)]
+    else:
+        if response.usage:
+            prompt_tokens = response.usage.prompt_tokens or 0
+            completion_tokens = response.usage.completion_tokens or 0
+        try:
+            content = json.loads(response.choices[0].message.content)
+            errors = validate_enhanced_content(content)
+        except Exception as e:
+            errors = [f"unreadable response: {e}"]
+
+    return {
+        "content": content,
+        "errors": errors,
+        "failed": failed,
+        "latency": time.monotonic() - start,
+        "prompt_tokens": prompt_tokens,
+        "completion_tokens": completion_tokens
+    }
+
+def build_enhancement_prompt(raw_text: str) -> str:
+    return f"""
         You are an expert educational content designer. Analyze this lesson plan content and transform it into a well-structured, engaging learning module.
 
         Original content:
@@ -78,29 +263,64 @@ def enhance_content_with_ai(raw_text: str, title: str) -> Dict:
         }}
         """
 
-        response = client.chat.completions.create(
-            model="gpt-5",
-            messages=[
-                {"role": "system", "content": "You are an expert educational content designer who creates engaging, well-structured learning materials."},
-                {"role": "user", "content": prompt}
-            ],
-            response_format={"type": "json_object"}
-        )
+def enhance_content_with_ai(raw_text: str, title: str, page_count: Optional[int] = None,
+                            latency_budget: float = LATENCY_BUDGET_SECONDS,
+                            cost_budget: float = COST_BUDGET_USD) -> Dict:
+    """Use OpenAI to analyze and enhance the PDF content, routing by document size and budget"""
+    if page_count is None:
+        # Roughly one page per 3000 characters of extracted text
+        page_count = max(1, len(raw_text) // 3000)
+    prompt = build_enhancement_prompt(raw_text)
 
-        enhanced_content = json.loads(response.choices[0].message.content)
-        return enhanced_content
+    tier_index = select_model_tier(raw_text, page_count, latency_budget, cost_budget)
+    if tier_index is None:
+        print(f"   ⚠ No model tier fits the budget ({latency_budget}s, ${cost_budget}), skipping AI enhancement")
 
-    except Exception as e:
-        print(f"AI enhancement failed: {e}")
-        # Fallback to basic structure
-        return {
-            "introduction": f"Welcome to {title}. This lesson will help you understand key concepts and develop practical skills.",
-            "learning_objectives": ["Understand core concepts", "Apply knowledge practically", "Demonstrate mastery"],
-            "sections": [{"title": "Content", "content": raw_text}],
-            "quiz": [],
-            "activity": {"title": "Practice Exercise", "description": "Apply what you've learned in a practical exercise."},
-            "summary": "Review the key concepts covered in this lesson and practice applying them."
-        }
+    while tier_index is not None:
+        tier = MODEL_TIERS[tier_index]
+        print(f"   → Using {tier['name']} tier ({tier['model']})")
+        result = call_model_tier(tier, prompt)
+        rejected = bool(result['errors']) and not result['failed']
+
+        next_index = None
+        if rejected:
+            # Charge the rejected call against the budget before picking a larger tier
+            spent_tokens = (result['prompt_tokens'] + result['completion_tokens']) or estimate_tokens(raw_text)
+            latency_budget -= result['latency']
+            cost_budget -= spent_tokens / 1000 * tier['usd_per_1k_tokens']
+            larger = [i for i in affordable_tiers(raw_text, latency_budget, cost_budget) if i > tier_index]
+            next_index = larger[0] if larger else None
+
+        try:
+            record_tier_metrics(tier['name'], result['latency'], result['prompt_tokens'],
+                                result['completion_tokens'], next_index is not None, rejected,
+                                result['failed'])
+        except Exception as e:
+            print(f"   ⚠ Could not record tier metrics: {e}")
+
+        if not result['errors']:
+            return result['content']
+
+        if result['failed']:
+            # An API outage says nothing about output quality and usually affects
+            # every tier, so it goes straight to the fallback instead of escalating
+            print(f"   ⚠ {tier['name']} tier call failed: {result['errors'][0]}")
+            break
+
+        print(f"   ⚠ {tier['name']} tier output rejected: {'; '.join(result['errors'][:3])}")
+        tier_index = next_index
+
+    print("AI enhancement failed within the model tier budget")
+    # Fallback to basic structure, flagged so the package is regenerated on the next run
+    return {
+        "fallback": True,
+        "introduction": f"Welcome to {title}. This lesson will help you understand key concepts and develop practical skills.",
+        "learning_objectives": ["Understand core concepts", "Apply knowledge practically", "Demonstrate mastery"],
+        "sections": [{"title": "Content", "content": raw_text}],
+        "quiz": [],
+        "activity": {"title": "Practice Exercise", "description": "Apply what you've learned in a practical exercise."},
+        "summary": "Review the key concepts covered in this lesson and practice applying them."
+    }
 
 def build_enhanced_html(enhanced_content: Dict, title: str) -> str:
     """Build a modern, interactive HTML learning module"""
@@ -631,18 +851,128 @@ def build_manifest_scorm12(title: str, org_id: str, sco_id: str, course_id: str,
 </manifest>
 '''
 
+def build_deterministic_zip(entries: Dict[str, str]) -> bytes:
+    """Zip files with fixed timestamps, ordering and compression so unchanged content gives identical bytes"""
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, 'w', zipfile.ZIP_DEFLATED) as zipf:
+        for arcname in sorted(entries):
+            info = zipfile.ZipInfo(arcname, date_time=ZIP_FIXED_DATE_TIME)
+            info.compress_type = zipfile.ZIP_DEFLATED
+            info.create_system = 3  # Unix, regardless of the building host
+            info.external_attr = 0o644 << 16
+            with open(entries[arcname], 'rb') as f:
+                zipf.writestr(info, f.read(), compresslevel=ZIP_COMPRESS_LEVEL)
+    return buffer.getvalue()
+
+def load_package_hashes(hash_file: str) -> Dict:
+    try:
+        with open(hash_file, 'r', encoding='utf-8') as f:
+            hashes = json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
+    return hashes if isinstance(hashes, dict) else {}
+
+def compute_source_hash(pdf_path: str, config: Dict) -> str:
+    """Hash the source PDF together with the settings that shape the generated package"""
+    digest = hashlib.sha256()
+    with open(pdf_path, 'rb') as f:
+        digest.update(f.read())
+    digest.update(json.dumps(config, sort_keys=True).encode('utf-8'))
+    return digest.hexdigest()
+
+def template_fingerprint() -> str:
+    """Hash the prompt, HTML and manifest templates by rendering them with fixed sample input"""
+    sample = {
+        "introduction": "intro",
+        "learning_objectives": ["objective"],
+        "sections": [{"title": "section", "content": "content"}],
+        "quiz": [{"question": "question", "options": ["a", "b"], "correct": 0, "explanation": "why"}],
+        "activity": {"title": "activity", "description": "description"},
+        "summary": "summary"
+    }
+    digest = hashlib.sha256()
+    digest.update(build_enhancement_prompt('').encode('utf-8'))
+    digest.update(build_enhanced_html(sample, 'title').encode('utf-8'))
+    digest.update(build_manifest_scorm12('title', 'org', 'sco', 'course', 'index.html').encode('utf-8'))
+    return digest.hexdigest()
+
+def package_config() -> Dict:
+    return {
+        "generator_version": GENERATOR_VERSION,
+        "templates": template_fingerprint(),
+        "title": PACKAGE_TITLE,
+        "sco": SCO_IDENTIFIER,
+        "org": ORG_IDENTIFIER,
+        "course": COURSE_IDENTIFIER,
+        "launch_file": LAUNCH_FILE,
+        "scorm_version": SCORM_VERSION,
+        "model_tiers": MODEL_TIERS,
+        "latency_budget_seconds": LATENCY_BUDGET_SECONDS,
+        "cost_budget_usd": COST_BUDGET_USD,
+        "expected_output_tokens": EXPECTED_OUTPUT_TOKENS
+    }
+
+def _file_sha256(path: str) -> Optional[str]:
+    try:
+        with open(path, 'rb') as f:
+            return hashlib.sha256(f.read()).hexdigest()
+    except FileNotFoundError:
+        return None
+
+def is_package_current(source_hash: str, output_zip: str, hash_file: str) -> bool:
+    """True when the zip on disk is the non-degraded package built from the same source and config"""
+    previous = load_package_hashes(hash_file)
+    if previous.get('degraded') or previous.get('source_sha256') != source_hash:
+        return False
+    return previous.get('sha256') is not None and _file_sha256(output_zip) == previous['sha256']
+
+def write_scorm_package(entries: Dict[str, str], output_zip: str, hash_file: str,
+                        source_hash: Optional[str] = None, degraded: bool = False) -> Tuple[bool, str]:
+    """Write the package and its hash sidecar. Returns (changed, package digest).
+
+    A degraded package (built from fallback content) is marked so the next run regenerates it.
+    """
+    data = build_deterministic_zip(entries)
+    digest = hashlib.sha256(data).hexdigest()
+
+    changed = _file_sha256(output_zip) != digest
+    if changed:
+        with open(output_zip, 'wb') as f:
+            f.write(data)
+
+    sidecar = {
+        "package": os.path.basename(output_zip),
+        "sha256": digest,
+        "size": len(data),
+        "files": {arcname: _file_sha256(entries[arcname]) for arcname in sorted(entries)},
+        "degraded": degraded
+    }
+    if source_hash:
+        sidecar['source_sha256'] = source_hash
+    with open(hash_file, 'w', encoding='utf-8') as f:
+        json.dump(sidecar, f, indent=2, sort_keys=True)
+        f.write("\n")
+    return changed, digest
+
 def main():
     print("🚀 Starting Enhanced PDF to SCORM Conversion...")
+
+    # 0) Skip everything, including the model calls, if the source is unchanged
+    source_hash = compute_source_hash(PDF_INPUT, package_config())
+    if is_package_current(source_hash, OUTPUT_ZIP, PACKAGE_HASH_FILE):
+        print("   ℹ Source PDF and config unchanged, skipping regeneration (LMS upload not needed)")
+        print(f"   📁 Package: {OUTPUT_ZIP}")
+        return
     
     # 1) Extract text from PDF
     print("📄 Extracting text from PDF...")
-    text = extract_pdf_text(PDF_INPUT)
-    print(f"   ✓ Extracted {len(text)} characters")
+    text, page_count = extract_pdf_text(PDF_INPUT)
+    print(f"   ✓ Extracted {len(text)} characters from {page_count} pages")
 
     # 2) Enhance content with AI
     print("🤖 Enhancing content with OpenAI...")
     try:
-        enhanced_content = enhance_content_with_ai(text, PACKAGE_TITLE)
+        enhanced_content = enhance_content_with_ai(text, PACKAGE_TITLE, page_count)
         print(f"   ✓ Generated {len(enhanced_content.get('sections', []))} sections")
         print(f"   ✓ Created {len(enhanced_content.get('quiz', []))} quiz questions")
         print(f"   ✓ Added {len(enhanced_content.get('learning_objectives', []))} learning objectives")
@@ -650,6 +980,7 @@ def main():
         print(f"   ⚠ AI enhancement failed: {e}")
         print("   ℹ Using fallback content structure")
         enhanced_content = {
+            "fallback": True,
             "introduction": f"Welcome to {PACKAGE_TITLE}",
             "learning_objectives": ["Understand core concepts", "Apply knowledge practically"],
             "sections": [{"title": "Content", "content": text}],
@@ -664,6 +995,9 @@ def main():
     with open(LAUNCH_FILE, 'w', encoding='utf-8') as f:
         f.write(html_content)
     print("   ✓ Created interactive learning module")
+    degraded = bool(enhanced_content.get('fallback'))
+    if degraded:
+        print("   ⚠ Built from fallback content, the package will be regenerated on the next run")
 
     # 4) Create imsmanifest.xml
     print("📋 Creating SCORM manifest...")
@@ -674,12 +1008,19 @@ def main():
 
     # 5) Zip into a SCORM package
     print("📦 Creating SCORM package...")
-    with zipfile.ZipFile(OUTPUT_ZIP, 'w', zipfile.ZIP_DEFLATED) as zipf:
-        zipf.write('pdf_to_scorm/imsmanifest.xml', 'imsmanifest.xml')
-        zipf.write(LAUNCH_FILE, 'index.html')
-    
-    print("🎉 SCORM package created successfully!")
+    package_entries = {
+        'imsmanifest.xml': 'pdf_to_scorm/imsmanifest.xml',
+        'index.html': LAUNCH_FILE
+    }
+    changed, package_hash = write_scorm_package(package_entries, OUTPUT_ZIP, PACKAGE_HASH_FILE,
+                                                source_hash, degraded)
+
+    if changed:
+        print("🎉 SCORM package created successfully!")
+    else:
+        print("   ℹ Package content unchanged, skipping rewrite (LMS upload not needed)")
     print(f"   📁 Package: {OUTPUT_ZIP}")
+    print(f"   🔑 SHA-256: {package_hash} ({PACKAGE_HASH_FILE})")
     print(f"   🌐 Preview: Open {LAUNCH_FILE} in browser")
     print("   🎯 Features: Interactive quizzes, progress tracking, modern UI")
 
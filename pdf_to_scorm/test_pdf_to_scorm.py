@@ -0,0 +1,283 @@
+import importlib.util
+import io
+import os
+import zipfile
+from pathlib import Path
+
+import pytest
+
+pytest.importorskip('openai')
+pytest.importorskip('PyPDF2')
+
+# The script builds its OpenAI client at import time
+os.environ.setdefault('OPENAI_API_KEY', 'test-key')
+_spec = importlib.util.spec_from_file_location('pdf_to_scorm_script', Path(__file__).with_name('test.py'))
+scorm = importlib.util.module_from_spec(_spec)
+_spec.loader.exec_module(scorm)
+
+
+@pytest.fixture
+def entries(tmp_path):
+    manifest = tmp_path / 'imsmanifest.xml'
+    index = tmp_path / 'index.html'
+    manifest.write_text('<manifest/>', encoding='utf-8')
+    index.write_text('<html></html>', encoding='utf-8')
+    return {'index.html': str(index), 'imsmanifest.xml': str(manifest)}
+
+
+def test_deterministic_zip_ignores_mtimes(entries):
+    first = scorm.build_deterministic_zip(entries)
+    for path in entries.values():
+        os.utime(path, (1_700_000_000, 1_700_000_000))
+    second = scorm.build_deterministic_zip(entries)
+
+    assert first == second
+    with zipfile.ZipFile(io.BytesIO(first)) as zipf:
+        assert zipf.namelist() == ['imsmanifest.xml', 'index.html']
+        assert all(info.date_time == scorm.ZIP_FIXED_DATE_TIME for info in zipf.infolist())
+
+
+def test_write_scorm_package_skips_unchanged_content(entries, tmp_path):
+    output_zip = str(tmp_path / 'package.zip')
+    hash_file = str(tmp_path / 'package.sha256.json')
+
+    changed, digest = scorm.write_scorm_package(entries, output_zip, hash_file, 'src')
+    assert changed
+    assert scorm.load_package_hashes(hash_file)['sha256'] == digest
+
+    changed, same_digest = scorm.write_scorm_package(entries, output_zip, hash_file, 'src')
+    assert not changed
+    assert same_digest == digest
+
+    os.remove(output_zip)
+    changed, _ = scorm.write_scorm_package(entries, output_zip, hash_file, 'src')
+    assert changed
+    assert os.path.exists(output_zip)
+
+
+def test_package_is_current_only_for_same_source(entries, tmp_path):
+    pdf = tmp_path / 'lesson.pdf'
+    pdf.write_bytes(b'%PDF-1.4 lesson')
+    output_zip = str(tmp_path / 'package.zip')
+    hash_file = str(tmp_path / 'package.sha256.json')
+
+    source_hash = scorm.compute_source_hash(str(pdf), {'title': 'A'})
+    assert not scorm.is_package_current(source_hash, output_zip, hash_file)
+
+    scorm.write_scorm_package(entries, output_zip, hash_file, source_hash)
+    assert scorm.is_package_current(source_hash, output_zip, hash_file)
+    assert not scorm.is_package_current(scorm.compute_source_hash(str(pdf), {'title': 'B'}),
+                                        output_zip, hash_file)
+
+
+def test_degraded_or_modified_package_is_not_current(entries, tmp_path):
+    output_zip = str(tmp_path / 'package.zip')
+    hash_file = str(tmp_path / 'package.sha256.json')
+
+    scorm.write_scorm_package(entries, output_zip, hash_file, 'src', degraded=True)
+    assert not scorm.is_package_current('src', output_zip, hash_file)
+
+    scorm.write_scorm_package(entries, output_zip, hash_file, 'src')
+    assert scorm.is_package_current('src', output_zip, hash_file)
+
+    with open(output_zip, 'ab') as f:
+        f.write(b'tampered')
+    assert not scorm.is_package_current('src', output_zip, hash_file)
+
+
+def test_package_config_tracks_prompt_and_budget(monkeypatch):
+    config = scorm.package_config()
+    monkeypatch.setattr(scorm, 'COST_BUDGET_USD', scorm.COST_BUDGET_USD * 2)
+    assert scorm.package_config() != config
+
+    monkeypatch.undo()
+    monkeypatch.setattr(scorm, 'build_enhancement_prompt', lambda raw_text: 'a different prompt')
+    assert scorm.package_config()['templates'] != config['templates']
+
+
+def test_load_package_hashes_ignores_wrong_shape(tmp_path):
+    hash_file = tmp_path / 'package.sha256.json'
+    hash_file.write_text('[]', encoding='utf-8')
+    assert scorm.load_package_hashes(str(hash_file)) == {}
+
+
+
+def valid_content():
+    return {
+        "introduction": "Welcome",
+        "learning_objectives": ["Build an argument"],
+        "sections": [{"title": "Claims", "content": "A claim is..."}],
+        "quiz": [{"question": "Pick one", "options": ["A) yes", "B) no"], "correct": 0, "explanation": "Because"}],
+        "activity": {"title": "Debate", "description": "Argue both sides"},
+        "summary": "Done"
+    }
+
+
+def test_select_model_tier_size_limits():
+    fast = scorm.MODEL_TIERS[0]
+    assert scorm.select_model_tier('x' * fast['max_chars'], fast['max_pages']) == 0
+    assert scorm.select_model_tier('x' * (fast['max_chars'] + 1), 1) == 1
+    assert scorm.select_model_tier('x' * 100, fast['max_pages'] + 1) == 1
+
+
+def test_select_model_tier_budget_limits():
+    text = 'x' * 30000
+    tokens = scorm.estimate_tokens(text)
+    large = scorm.MODEL_TIERS[1]
+    latency = tokens / 1000 * large['seconds_per_1k_tokens']
+    cost = tokens / 1000 * large['usd_per_1k_tokens']
+
+    assert scorm.select_model_tier(text, 1, latency, cost) == 1
+    assert scorm.select_model_tier(text, 1, latency - 0.01, cost) == 0
+    assert scorm.select_model_tier(text, 1, latency, cost - 0.001) == 0
+    assert scorm.select_model_tier(text, 1, 0, 0) is None
+
+
+def test_validate_enhanced_content_accepts_valid_output():
+    assert scorm.validate_enhanced_content(valid_content()) == []
+
+
+@pytest.mark.parametrize('mutate', [
+    lambda c: c.update(sections=[]),
+    lambda c: c.update(sections=[{"title": "No content"}]),
+    lambda c: c.update(learning_objectives=["ok", 3]),
+    lambda c: c['quiz'][0].update(options=["A) yes", None]),
+    lambda c: c['quiz'][0].update(options=[]),
+    lambda c: c['quiz'][0].update(correct=2),
+    lambda c: c['quiz'][0].update(correct="0"),
+    lambda c: c.update(quiz={"question": "not a list"}),
+    lambda c: c.update(activity={"title": "No description"}),
+])
+def test_validate_enhanced_content_rejects_bad_shapes(mutate):
+    content = valid_content()
+    mutate(content)
+    assert scorm.validate_enhanced_content(content)
+
+
+@pytest.mark.parametrize('existing', ['[]', '{"fast": {"calls": 1}}', '{"fast": []}'])
+def test_record_tier_metrics_tolerates_bad_metrics_file(tmp_path, existing):
+    metrics_file = tmp_path / 'metrics.json'
+    metrics_file.write_text(existing, encoding='utf-8')
+
+    stats = scorm.record_tier_metrics('fast', 1.0, 10, 20, False, True, metrics_file=str(metrics_file))
+    assert stats['rejections'] == 1
+    assert stats['escalations'] == 0
+    assert scorm.load_tier_metrics(str(metrics_file))['fast'] == stats
+
+
+class FakeCompletions:
+    def __init__(self, replies):
+        self.replies = replies
+        self.models = []
+
+    def create(self, model, **kwargs):
+        self.models.append(model)
+        if isinstance(self.replies[model], Exception):
+            raise self.replies[model]
+        message = type('Message', (), {'content': scorm.json.dumps(self.replies[model])})
+        choice = type('Choice', (), {'message': message})
+        return type('Response', (), {'choices': [choice], 'usage': None})
+
+
+def fake_client(monkeypatch, tmp_path, replies):
+    completions = FakeCompletions(replies)
+    chat = type('Chat', (), {'completions': completions})
+    monkeypatch.setattr(scorm, 'client', type('Client', (), {'chat': chat}))
+    # METRICS_FILE is relative to the repo root
+    (tmp_path / 'pdf_to_scorm').mkdir()
+    monkeypatch.chdir(tmp_path)
+    return completions
+
+
+def test_enhance_escalates_when_fast_output_is_invalid(monkeypatch, tmp_path):
+    completions = fake_client(monkeypatch, tmp_path, {'gpt-5-mini': {"introduction": ""}, 'gpt-5': valid_content()})
+
+    assert scorm.enhance_content_with_ai('short lesson', 'Lesson', 1) == valid_content()
+    assert completions.models == ['gpt-5-mini', 'gpt-5']
+    metrics = scorm.load_tier_metrics()
+    assert metrics['fast']['escalations'] == 1
+    assert metrics['large']['rejections'] == 0
+
+
+def test_enhance_does_not_escalate_past_budget(monkeypatch, tmp_path):
+    completions = fake_client(monkeypatch, tmp_path, {'gpt-5-mini': {"introduction": ""}, 'gpt-5': valid_content()})
+    monkeypatch.setattr(scorm, 'affordable_tiers', lambda *args: [0])
+
+    content = scorm.enhance_content_with_ai('short lesson', 'Lesson', 1)
+    assert completions.models == ['gpt-5-mini']
+    assert content['sections'] == [{"title": "Content", "content": 'short lesson'}]
+    metrics = scorm.load_tier_metrics()
+    assert metrics['fast']['escalations'] == 0
+    assert metrics['fast']['rejections'] == 1
+
+
+@pytest.mark.parametrize('latency_budget, cost_budget, fast_latency', [
+    (20, scorm.COST_BUDGET_USD, 6.8),  # large fits 20s alone, not after 6.8s on fast
+    (scorm.LATENCY_BUDGET_SECONDS, 0.09, 0.0),  # large fits $0.09 alone, not after fast's tokens
+])
+def test_enhance_escalation_counts_spent_budget(monkeypatch, tmp_path, latency_budget, cost_budget, fast_latency):
+    completions = fake_client(monkeypatch, tmp_path, {'gpt-5-mini': {"introduction": ""}, 'gpt-5': valid_content()})
+    call_model_tier = scorm.call_model_tier
+
+    def slow_call(tier, prompt):
+        result = call_model_tier(tier, prompt)
+        result['latency'] = fast_latency
+        return result
+    monkeypatch.setattr(scorm, 'call_model_tier', slow_call)
+
+    text = 'x' * 20000
+    assert scorm.affordable_tiers(text, latency_budget, cost_budget) == [0, 1]
+    content = scorm.enhance_content_with_ai(text, 'Lesson', 1, latency_budget, cost_budget)
+    assert completions.models == ['gpt-5-mini']
+    assert content['fallback'] is True
+    assert scorm.load_tier_metrics()['fast']['escalations'] == 0
+
+
+def test_enhance_skips_model_when_nothing_fits_budget(monkeypatch, tmp_path):
+    completions = fake_client(monkeypatch, tmp_path, {'gpt-5-mini': valid_content()})
+
+    content = scorm.enhance_content_with_ai('short lesson', 'Lesson', 1, latency_budget=0, cost_budget=0)
+    assert completions.models == []
+    assert content['fallback'] is True
+
+
+def test_enhance_does_not_escalate_on_api_failure(monkeypatch, tmp_path):
+    completions = fake_client(monkeypatch, tmp_path, {'gpt-5-mini': ConnectionError('network down'),
+                                                      'gpt-5': valid_content()})
+
+    content = scorm.enhance_content_with_ai('short lesson', 'Lesson', 1)
+    assert completions.models == ['gpt-5-mini']
+    assert content['fallback'] is True
+    stats = scorm.load_tier_metrics()['fast']
+    assert (stats['failures'], stats['rejections'], stats['escalations']) == (1, 0, 0)
+
+
+def test_enhance_keeps_valid_output_when_metrics_fail(monkeypatch, tmp_path):
+    fake_client(monkeypatch, tmp_path, {'gpt-5-mini': valid_content()})
+
+    def broken_metrics(*args, **kwargs):
+        raise KeyError('escalations')
+    monkeypatch.setattr(scorm, 'record_tier_metrics', broken_metrics)
+
+    assert scorm.enhance_content_with_ai('short lesson', 'Lesson', 1) == valid_content()
+
+
+def test_main_regenerates_after_fallback_package(monkeypatch, tmp_path):
+    outage = ConnectionError('network down')
+    completions = fake_client(monkeypatch, tmp_path, {'gpt-5-mini': outage, 'gpt-5': outage})
+    (tmp_path / 'lesson.pdf').write_bytes(b'%PDF-1.4 lesson')
+    monkeypatch.setattr(scorm, 'PDF_INPUT', str(tmp_path / 'lesson.pdf'))
+    monkeypatch.setattr(scorm, 'extract_pdf_text', lambda pdf_path: ('short lesson', 1))
+
+    scorm.main()
+    assert scorm.load_package_hashes(scorm.PACKAGE_HASH_FILE)['degraded'] is True
+
+    completions.replies['gpt-5-mini'] = valid_content()
+    calls_before = len(completions.models)
+    scorm.main()
+    assert completions.models[calls_before:] == ['gpt-5-mini']
+    assert scorm.load_package_hashes(scorm.PACKAGE_HASH_FILE)['degraded'] is False
+
+    # A healthy package for an unchanged source is not regenerated
+    scorm.main()
+    assert len(completions.models) == calls_before + 1